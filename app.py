@@ -6,7 +6,7 @@
 #    On Windows (PowerShell): .\.venv\Scripts\Activate.ps1
 #
 # 2) Install dependencies:
-#    pip install fastapi strawberry-graphql uvicorn pymongo python-dotenv
+#    pip install fastapi strawberry-graphql uvicorn "pymongo[zstd]" motor python-dotenv cachetools orjson
 #
 # 3) Ensure MongoDB is running locally (default: mongodb://localhost:27017).
 #    Start a local instance with: mongod
@@ -27,7 +27,7 @@
 # - If you don't set any env vars, the app uses mongodb://localhost:27017 and DB 'simple_graphql_db'.
 # - python-dotenv is supported; place the variables above into a .env file in the project root.
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 # Compatibility patch for Python 3.10+ where ABCs moved to collections.abc
 import collections
 import collections.abc
@@ -44,11 +44,23 @@ if not hasattr(collections, "Sequence"):
 
 import strawberry
 from fastapi import FastAPI, Request, HTTPException, status
+from strawberry.dataloader import DataLoader
+from strawberry.extensions import ParserCache, SchemaExtension, ValidationCache
 from strawberry.fastapi import GraphQLRouter
-from pymongo import MongoClient, ReturnDocument
+from strawberry.types import Info
+from cachetools import TTLCache
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 from dotenv import load_dotenv
+import hmac
 import os
-import json
+import orjson
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from starlette.responses import Response
 
 # Load environment variables from .env if present (override any existing env)
@@ -77,7 +89,11 @@ def reload_env_if_changed() -> None:
 reload_env_if_changed()
 
 # --- Security: API Secret ---
-# Note: Do not cache API_SECRET; always read from environment after potential reload.
+# API_SECRET is cached and refreshed together with the throttled .env check in the middleware,
+# so an edited .env is picked up within _ENV_CHECK_INTERVAL seconds.
+_ENV_CHECK_INTERVAL = 5.0
+_LAST_ENV_CHECK = time.monotonic()
+_API_SECRET: Optional[str] = os.getenv("API_SECRET")
 
 # --- Database Setup ---
 # Connect to MongoDB. It is highly recommended to use an environment variable
@@ -93,12 +109,39 @@ if mongo_username and mongo_password:
     mongo_uri = f"mongodb://{mongo_username}:{mongo_password}@{mongo_host}/"
 else:
     mongo_uri = f"mongodb://{mongo_host}/"
-client = MongoClient(mongo_uri)
+# Async driver so database round trips do not block the event loop.
+# One client (and pool) per process: run multiple uvicorn `--workers` processes rather than
+# sharing a client across threads/forks. Pool bounds are explicit to smooth out bursts, and
+# wire compression (zstd, falling back to stdlib zlib) cuts bandwidth for large `data` payloads.
+client = AsyncIOMotorClient(
+    mongo_uri,
+    maxPoolSize=50,
+    minPoolSize=10,
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+    retryWrites=True,
+    compressors="zstd,zlib",
+)
 
 # Select the database and collection
 db = client[mongo_db_name]
 documents_collection = db.documents
 
+# Only the fields DocumentType needs; avoids transferring and decoding anything else stored.
+_PROJECTION = {"identifier": 1, "type": 1, "data": 1, "_id": 1}
+
+# Documents fetched per server round trip when iterating list cursors.
+_LIST_BATCH_SIZE = 500
+
+
+@lru_cache(maxsize=256)
+def _resolve_collection_name(doc_type: str) -> str:
+    """Sanitize `doc_type` into a collection name; "" means use the default collection.
+    Cached since the set of document types in use is small.
+    """
+    # Basic sanitization: allow alphanumeric and underscore; lower-case name
+    return ''.join(ch for ch in doc_type if ch.isalnum() or ch == '_').lower()
+
 
 def collection_for_type(doc_type: Optional[str]):
     """Resolve the MongoDB collection to operate on based on `type`.
@@ -107,11 +150,38 @@ def collection_for_type(doc_type: Optional[str]):
     """
     if not doc_type:
         return documents_collection
-    # Basic sanitization: allow alphanumeric and underscore; lower-case name
-    safe = ''.join(ch for ch in doc_type if ch.isalnum() or ch == '_').lower()
-    if not safe:
-        return documents_collection
-    return db[safe]
+    name = _resolve_collection_name(doc_type)
+    return db[name] if name else documents_collection
+
+
+# Collections known to have (or to be unable to get) the unique `identifier` index, so the
+# index build is only attempted once per collection per process.
+_INDEXED_COLLECTIONS: set[str] = set()
+_UNINDEXED_COLLECTIONS: set[str] = set()
+
+
+async def ensure_identifier_index(coll) -> bool:
+    """Create the unique index on `identifier` for `coll` if not done yet in this process.
+    The name matches the one used by docker/initdb so an existing index is reused as-is.
+    Returns False if the index could not be created; callers must then check for duplicates themselves.
+    """
+    if coll.name in _INDEXED_COLLECTIONS:
+        return True
+    if coll.name in _UNINDEXED_COLLECTIONS:
+        return False
+    try:
+        await coll.create_index("identifier", unique=True, name="identifier_unique")
+    except OperationFailure as e:
+        # E.g. existing duplicates in legacy data; keep serving with explicit duplicate checks
+        print(f"Could not ensure unique identifier index on '{coll.name}': {e}")
+        _UNINDEXED_COLLECTIONS.add(coll.name)
+        return False
+    _INDEXED_COLLECTIONS.add(coll.name)
+    return True
+
+
+class DuplicateDocumentError(ValueError):
+    """Raised when a (type, identifier) combination already exists or is repeated in one request."""
 
 
 # --- GraphQL Schema Definition ---
@@ -127,6 +197,18 @@ class DocumentType:
     data: str
 
 
+def _fast_doc(d: dict) -> DocumentType:
+    """Build a DocumentType from an already-normalized row without going through the
+    dataclass __init__; used on list paths where per-row overhead adds up.
+    """
+    o = DocumentType.__new__(DocumentType)
+    o.id = d['id']
+    o.identifier = d['identifier']
+    o.type = d['type']
+    o.data = d['data']
+    return o
+
+
 @strawberry.input
 class CreateDocumentInput:
     identifier: str
@@ -134,25 +216,92 @@ class CreateDocumentInput:
     data: str
 
 
+# --- DataLoaders ---
+# Documents requested in the same GraphQL operation (aliases, nested fields) are
+# coalesced into one `$in` query per type instead of one `find_one` per field.
+
+DocumentKey = Tuple[str, str]  # (type, identifier)
+
+# Short-lived cache of found documents shared across requests, in front of the loader's queries.
+# Enabled with ENABLE_READ_CACHE=1; leave it off where reads must see writes from other workers.
+# Keyed by (collection name, identifier): types that sanitize to the same collection share entries.
+# Only touched from the event loop, so no lock is needed. Loads do await between querying and
+# caching, though, so every invalidation is stamped with an increasing epoch and a load only
+# caches a document if its key was not invalidated after the load started.
+_read_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_invalidated_at: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_cache_epoch = 0
+
+
+def read_cache_enabled() -> bool:
+    return os.getenv("ENABLE_READ_CACHE", "0") == "1"
+
+
+def invalidate_cached_documents(type: str, identifiers: List[str]) -> None:
+    global _cache_epoch
+    name = collection_for_type(type).name
+    _cache_epoch += 1
+    for identifier in identifiers:
+        _read_cache.pop((name, identifier), None)
+        _invalidated_at[(name, identifier)] = _cache_epoch
+
+
+def _may_cache(key: Tuple[str, str], start_epoch: int) -> bool:
+    """Whether a document read by a load that started at `start_epoch` is still safe to cache."""
+    # Stamps may have been evicted if more invalidations than the stamp cache holds happened since
+    if _cache_epoch - start_epoch >= _invalidated_at.maxsize:
+        return False
+    return _invalidated_at.get(key, 0) <= start_epoch
+
+
+def make_document_loader() -> DataLoader[DocumentKey, Optional[DocumentType]]:
+    """Create a request-scoped DataLoader for documents keyed by `(type, identifier)`."""
+
+    async def batch_load(keys: List[DocumentKey]) -> List[Optional[DocumentType]]:
+        found: dict[DocumentKey, DocumentType] = {}
+        use_cache = read_cache_enabled()
+        start_epoch = _cache_epoch
+        if use_cache:
+            for t, identifier in keys:
+                cached = _read_cache.get((collection_for_type(t).name, identifier))
+                if cached is not None:
+                    found[(t, identifier)] = cached
+
+        # Group remaining identifiers by type so each collection is queried once
+        groups: dict[str, list[str]] = {}
+        for t, identifier in keys:
+            if (t, identifier) not in found:
+                groups.setdefault(t, []).append(identifier)
+
+        for t, ids in groups.items():
+            coll = collection_for_type(t)
+            cursor = coll.find({"identifier": {"$in": ids}}, projection=_PROJECTION)
+            async for d in cursor:
+                d.setdefault('type', t)
+                d['id'] = str(d['_id'])
+                d.pop('_id', None)
+                doc = _fast_doc(d)
+                found[(t, doc.identifier)] = doc
+                if use_cache and _may_cache((coll.name, doc.identifier), start_epoch):
+                    _read_cache[(coll.name, doc.identifier)] = doc
+        # Results must line up with the requested keys; misses resolve to None
+        return [found.get(key) for key in keys]
+
+    return DataLoader(load_fn=batch_load)
+
+
 # Define the Query class. This contains fields for fetching data.
 @strawberry.type
 class Query:
     @strawberry.field
-    def get_document(self, identifier: str, type: str) -> Optional[DocumentType]:
-        """Fetches a single document by its unique identifier and type."""
-        coll = collection_for_type(type)
-        doc = coll.find_one({"identifier": identifier})
-        if doc:
-            if 'type' not in doc:
-                doc['type'] = type
-            # MongoDB's unique ID is an ObjectId; convert it to string and remove the raw field.
-            doc['id'] = str(doc['_id'])
-            doc.pop('_id', None)
-            return DocumentType(**doc)
-        return None
+    async def get_document(self, info: Info, identifier: str, type: str) -> Optional[DocumentType]:
+        """Fetches a single document by its unique identifier and type.
+        Lookups are batched per request through the document DataLoader.
+        """
+        return await info.context["document_loader"].load((type, identifier))
 
     @strawberry.field
-    def get_documents(self, type: str, identifiers: List[str]) -> List[DocumentType]:
+    async def get_documents(self, type: str, identifiers: List[str]) -> List[DocumentType]:
         """Fetch multiple documents by identifiers for the given type.
         Returns only those found. If an identifier is missing, it is simply not included.
         The order of results follows the order of the provided identifiers.
@@ -160,35 +309,70 @@ class Query:
         if not identifiers:
             return []
         coll = collection_for_type(type)
-        cursor = coll.find({"identifier": {"$in": identifiers}})
-        found = {}
-        for d in cursor:
-            if 'type' not in d:
-                d['type'] = type
+        # Query each identifier once; repeated identifiers are expanded again below
+        unique_ids = list(dict.fromkeys(identifiers))
+        # Let MongoDB sort by position in the input list so results stream back already in order.
+        # The identifier list appears in both $match (to use the index) and $indexOfArray, so it
+        # counts twice toward the 16 MB command limit; accepted for batch sizes this API serves.
+        cursor = coll.aggregate([
+            {"$match": {"identifier": {"$in": unique_ids}}},
+            {"$addFields": {"_ord": {"$indexOfArray": [unique_ids, "$identifier"]}}},
+            {"$sort": {"_ord": 1}},
+            {"$project": _PROJECTION},
+        ])
+        docs: List[DocumentType] = []
+        async for d in cursor:
+            # Collections without the unique index may hold several rows per identifier;
+            # they arrive next to each other after the sort, so keep only the first one
+            if docs and docs[-1].identifier == d['identifier']:
+                continue
+            d.setdefault('type', type)
             d['id'] = str(d['_id'])
             d.pop('_id', None)
-            found[d['identifier']] = DocumentType(**d)
-        # Preserve input order
+            docs.append(_fast_doc(d))
+        if len(unique_ids) == len(identifiers):
+            return docs
+        # Return one result per requested identifier, repeating results for repeated identifiers
+        found = {doc.identifier: doc for doc in docs}
         return [found[i] for i in identifiers if i in found]
 
     @strawberry.field
-    def list_documents(self, type: Optional[str] = None) -> List[DocumentType]:
+    async def list_documents(
+        self,
+        type: Optional[str] = None,
+        first: Optional[int] = None,
+        after: Optional[strawberry.ID] = None,
+    ) -> List[DocumentType]:
         """Fetches documents.
-        - If `type` is provided, returns all documents from that type's collection.
+        - If `type` is provided, returns documents from that type's collection.
         - Otherwise, returns documents from the default `documents` collection.
+        - `first`/`after` page through results ordered by `id`: pass the `id` of the last
+          document received as `after` to fetch the next page. Without them, all documents are returned.
         """
+        if first is not None and first < 1:
+            raise ValueError("`first` must be a positive integer")
+        filter_query = {}
+        if after is not None:
+            try:
+                filter_query["_id"] = {"$gt": ObjectId(after)}
+            except InvalidId:
+                raise ValueError(f"Invalid `after` cursor: '{after}'")
+
+        coll = collection_for_type(type) if type else documents_collection
+        # Fetch from the server in fixed-size batches rather than one large reply
+        cursor = coll.find(filter_query, projection=_PROJECTION, batch_size=_LIST_BATCH_SIZE)
+        if first is not None or after is not None:
+            cursor = cursor.sort("_id", 1)
+        if first is not None:
+            cursor = cursor.limit(first)
+
         docs: List[DocumentType] = []
-        if type:
-            coll = collection_for_type(type)
-            cursor = coll.find()
-        else:
-            cursor = documents_collection.find()
-        for d in cursor:
+        async for d in cursor:
             d['id'] = str(d['_id'])
             d.pop('_id', None)
-            if type and 'type' not in d:
-                d['type'] = type
-            docs.append(DocumentType(**d))
+            if type:
+                d.setdefault('type', type)
+            docs.append(_fast_doc(d))
         return docs
 
 
@@ -196,25 +380,28 @@ class Query:
 @strawberry.type
 class Mutation:
     @strawberry.field
-    def create_document(self, identifier: str, type: str, data: str) -> DocumentType:
+    async def create_document(self, identifier: str, type: str, data: str) -> DocumentType:
         """Creates a new document in the database.
         Prevents duplicates for the same (type, identifier) combination.
         """
         coll = collection_for_type(type)
-        # Prevent duplicate by checking existing identifier within the collection for this type
-        existing = coll.find_one({"identifier": identifier})
-        if existing:
-            raise ValueError(f"Document with identifier '{identifier}' and type '{type}' already exists")
-
+        # Rely on the unique index rather than a racy check-then-insert; only collections
+        # where the index could not be built fall back to checking first
+        if not await ensure_identifier_index(coll):
+            if await coll.find_one({"identifier": identifier}, projection={"_id": 1}):
+                raise DuplicateDocumentError(f"Document with identifier '{identifier}' and type '{type}' already exists")
         new_doc = {'identifier': identifier, 'type': type, 'data': data}
-        result = coll.insert_one(new_doc)
+        try:
+            result = await coll.insert_one(new_doc)
+        except DuplicateKeyError:
+            raise DuplicateDocumentError(f"Document with identifier '{identifier}' and type '{type}' already exists")
         new_doc['id'] = str(result.inserted_id)
         # Ensure no raw Mongo _id leaks into the GraphQL type
         new_doc.pop('_id', None)
         return DocumentType(**new_doc)
 
     @strawberry.field
-    def create_documents(self, items: List[CreateDocumentInput]) -> List[DocumentType]:
+    async def create_documents(self, items: List[CreateDocumentInput]) -> List[DocumentType]:
         """Creates multiple documents in batches grouped by their type.
         All-or-nothing: if any (type, identifier) already exists or is duplicated within input,
         an error is raised and nothing is inserted.
@@ -234,36 +421,60 @@ class Mutation:
 
         # Validate no duplicate identifiers within the same type in the input
         for t, docs in groups.items():
-            ids = [d['identifier'] for d in docs]
-            dupes = {i for i in ids if ids.count(i) > 1}
+            seen: set[str] = set()
+            dupes: set[str] = set()
+            for d in docs:
+                i = d['identifier']
+                if i in seen:
+                    dupes.add(i)
+                else:
+                    seen.add(i)
             if dupes:
-                raise ValueError(f"Duplicate identifiers in request for type '{t}': {sorted(list(dupes))}")
+                raise DuplicateDocumentError(f"Duplicate identifiers in request for type '{t}': {sorted(list(dupes))}")
 
-        # Check database for existing identifiers for each type before inserting (all-or-nothing)
+        # Collections without the unique index cannot reject duplicates on insert,
+        # so check those up front before anything is written
         for t, docs in groups.items():
             coll = collection_for_type(t)
-            ids = [d['identifier'] for d in docs]
-            existing = list(coll.find({"identifier": {"$in": ids}}, {"identifier": 1, "_id": 0}))
-            if existing:
-                existing_ids = sorted([e['identifier'] for e in existing])
-                raise ValueError(f"Documents already exist for type '{t}' with identifiers: {existing_ids}")
-
-        # If validation passes for all groups, perform inserts
-        created: List[DocumentType] = []
+            if not await ensure_identifier_index(coll):
+                ids = [d['identifier'] for d in docs]
+                existing = [e['identifier'] async for e in coll.find({"identifier": {"$in": ids}}, {"identifier": 1, "_id": 0})]
+                if existing:
+                    raise DuplicateDocumentError(f"Documents already exist for type '{t}' with identifiers: {sorted(existing)}")
+
+        # Insert every group without a read-first existence check; the unique index on `identifier`
+        # rejects duplicates atomically. Keep all-or-nothing semantics by rolling back what this
+        # request already inserted when any group reports duplicate keys.
+        inserted: list[tuple] = []
         for t, docs in groups.items():
-            if not docs:
-                continue
             coll = collection_for_type(t)
-            result = coll.insert_many(docs)
-            for doc, oid in zip(docs, result.inserted_ids):
-                doc['id'] = str(oid)
+            try:
+                await coll.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                existing_ids = sorted({docs[err['index']]['identifier'] for err in write_errors if err.get('code') == 11000})
+                # insert_many assigns `_id` to every input document, including the rejected ones
+                inserted.append((coll, t, [d for d in docs if '_id' in d]))
+                for c, inserted_type, inserted_docs in inserted:
+                    await c.delete_many({"_id": {"$in": [d['_id'] for d in inserted_docs]}})
+                    # A read between insert and rollback may have cached a now-deleted document
+                    invalidate_cached_documents(inserted_type, [d['identifier'] for d in inserted_docs])
+                if existing_ids:
+                    raise DuplicateDocumentError(f"Documents already exist for type '{t}' with identifiers: {existing_ids}")
+                raise
+            inserted.append((coll, t, docs))
+
+        created: List[DocumentType] = []
+        for docs in groups.values():
+            for doc in docs:
+                doc['id'] = str(doc['_id'])
                 # Remove Mongo's internal _id to avoid passing it to the GraphQL type
                 doc.pop('_id', None)
                 created.append(DocumentType(**doc))
         return created
 
     @strawberry.field
-    def update_document(self, identifier: str, type: str, new_data: Optional[str] = None) -> Optional[DocumentType]:
+    async def update_document(self, identifier: str, type: str, new_data: Optional[str] = None) -> Optional[DocumentType]:
         """Updates an existing document by its identifier and type."""
         coll = collection_for_type(type)
         filter_query = {"identifier": identifier}
@@ -275,14 +486,15 @@ class Mutation:
 
         if updates:
             # Find and update the document, returning the modified document.
-            updated_doc = coll.find_one_and_update(
+            updated_doc = await coll.find_one_and_update(
                 filter_query,
                 {"$set": updates},
+                projection=_PROJECTION,
                 return_document=ReturnDocument.AFTER
             )
+            invalidate_cached_documents(type, [identifier])
             if updated_doc:
-                if 'type' not in updated_doc:
-                    updated_doc['type'] = type
+                updated_doc.setdefault('type', type)
                 updated_doc['id'] = str(updated_doc['_id'])
                 updated_doc.pop('_id', None)
                 return DocumentType(**updated_doc)
@@ -290,99 +502,183 @@ class Mutation:
         return None
 
     @strawberry.field
-    def delete_document(self, identifier: str, type: str) -> bool:
+    async def delete_document(self, identifier: str, type: str) -> bool:
         """Deletes a document from the database by its identifier and type."""
         coll = collection_for_type(type)
-        result = coll.delete_one({"identifier": identifier})
+        result = await coll.delete_one({"identifier": identifier})
+        invalidate_cached_documents(type, [identifier])
         return result.deleted_count > 0
 
     @strawberry.field
-    def delete_documents(self, type: str, identifiers: List[str]) -> int:
+    async def delete_documents(self, type: str, identifiers: List[str]) -> int:
         """Deletes multiple documents by `identifier` for the given type.
         Returns the number of documents deleted.
         """
         coll = collection_for_type(type)
-        result = coll.delete_many({"identifier": {"$in": identifiers}})
+        result = await coll.delete_many({"identifier": {"$in": identifiers}})
+        invalidate_cached_documents(type, identifiers)
         return int(result.deleted_count)
 
 
 # --- API and GraphQL Integration ---
 
+# Internal response header marking GraphQL responses that contain errors. Set by the schema
+# extension below and stripped again by the middleware, which only buffers and inspects
+# bodies of responses carrying it.
+GRAPHQL_ERRORS_HEADER = "x-graphql-errors"
+
+
+# Error code attached to GraphQL errors caused by DuplicateDocumentError.
+DUPLICATE_ERROR_CODE = "DUPLICATE"
+
+
+class GraphQLErrorExtension(SchemaExtension):
+    """Tags duplicate-document errors with an error code and flags operations that
+    produced errors on the HTTP response.
+    """
+
+    def on_operation(self):
+        try:
+            yield
+        except Exception:
+            # Errors raised by other extensions (e.g. syntax errors from ParserCache) are thrown
+            # in here instead of being collected on the execution context
+            self._flag_response()
+            raise
+        execution_context = self.execution_context
+        if hasattr(execution_context, "pre_execution_errors"):
+            errors = execution_context.pre_execution_errors
+        else:  # Strawberry < 0.283
+            errors = execution_context.errors
+        errors = errors or getattr(execution_context.result, "errors", None)
+        if errors:
+            for error in errors:
+                if isinstance(error.original_error, DuplicateDocumentError):
+                    error.extensions = {**(error.extensions or {}), "code": DUPLICATE_ERROR_CODE}
+            self._flag_response()
+
+    def _flag_response(self) -> None:
+        response = self.execution_context.context.get("response")
+        if response is not None:
+            response.headers[GRAPHQL_ERRORS_HEADER] = "1"
+
 # Create a GraphQL schema from our Query and Mutation classes.
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+# Clients send a small, fixed set of query strings, so parsed and validated documents are cached
+# by query text instead of being rebuilt on every request.
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[lambda: ParserCache(maxsize=200), lambda: ValidationCache(maxsize=200), GraphQLErrorExtension],
+)
+
+async def ensure_indexes() -> None:
+    """Ensure the unique `identifier` index on all existing collections, including the default
+    `documents` collection (identifiers are unique per collection, whatever their type).
+    Collections created later get their index on first insert via ensure_identifier_index.
+    """
+    try:
+        names = await db.list_collection_names()
+        for name in names:
+            if not name.startswith("system."):
+                await ensure_identifier_index(db[name])
+    except PyMongoError as e:
+        # Do not block startup when MongoDB is unreachable; indexes are ensured again on insert
+        print(f"Could not ensure indexes at startup: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    yield
+
 
 # Create the FastAPI application.
 app = FastAPI(
     title="NoSQL GraphQL API with MongoDB",
     description="A simple API for unstructured documents using MongoDB.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Middleware to enforce API secret on every request if configured.
 @app.middleware("http")
 async def verify_api_secret(request: Request, call_next):
-    # Hot-reload .env if it changed
-    reload_env_if_changed()
-    api_secret = os.getenv("API_SECRET")
+    global _LAST_ENV_CHECK, _API_SECRET
+    # Hot-reload .env if it changed, checking the file at most once per interval
+    now = time.monotonic()
+    if now - _LAST_ENV_CHECK > _ENV_CHECK_INTERVAL:
+        _LAST_ENV_CHECK = now
+        reload_env_if_changed()
+        _API_SECRET = os.getenv("API_SECRET")
+    api_secret = _API_SECRET
     if api_secret:  # only enforce if configured
-        provided = request.headers.get("x-api-secret") or request.headers.get("X-Api-Secret")
-        if provided != api_secret:
+        # Starlette headers are case-insensitive, so one lookup covers X-API-SECRET etc.
+        provided = request.headers.get("x-api-secret")
+        # Constant-time comparison so response timing does not reveal how much of the secret matched
+        if not hmac.compare_digest((provided or "").encode(), api_secret.encode()):
             # Return a direct 401 response to avoid unhandled exceptions causing 500s in some setups
-            from starlette.responses import JSONResponse
-            return JSONResponse({"detail": "Invalid or missing API secret"}, status_code=status.HTTP_401_UNAUTHORIZED)
+            return Response(
+                content=orjson.dumps({"detail": "Invalid or missing API secret"}),
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                media_type="application/json",
+            )
 
     # Proceed to the next handler and possibly adjust status codes for GraphQL errors
     response = await call_next(request)
 
-    # Only post-process GraphQL responses to map known errors to HTTP status codes
-    if request.url.path.startswith("/graphql") and request.method.upper() == "POST":
-        try:
-            # Buffer the streaming body
-            body = b""
-            async for chunk in response.body_iterator:
-                body += chunk
+    # Successful responses are passed through without buffering the body
+    if GRAPHQL_ERRORS_HEADER not in response.headers:
+        return response
 
-            # Defaults
-            status_code = response.status_code
-            media_type = response.media_type or "application/json"
-            headers = dict(response.headers)
+    # Only post-process GraphQL POST responses with errors to map them to HTTP status codes;
+    # for anything else just drop the internal header
+    if not (request.url.path.startswith("/graphql") and request.method.upper() == "POST"):
+        del response.headers[GRAPHQL_ERRORS_HEADER]
+        return response
 
-            new_status = None
-            try:
-                payload = json.loads(body.decode() or "{}")
-            except Exception:
-                payload = None
-
-            if isinstance(payload, dict) and payload.get("errors"):
-                # Default to 400 for GraphQL errors
-                new_status = 400
-                # If duplicate-related errors detected, use 409 Conflict
-                messages = []
-                for err in payload.get("errors", []):
-                    if isinstance(err, dict):
-                        msg = (err.get("message") or "")
-                    else:
-                        msg = str(err)
-                    messages.append(msg.lower())
-                duplicate_markers = [
-                    "already exists",
-                    "documents already exist",
-                    "duplicate identifiers",
-                    "duplicate key error",
-                ]
-                if any(any(marker in m for marker in duplicate_markers) for m in messages):
-                    new_status = 409
-
-            # Rebuild the response with potentially updated status code
-            return Response(content=body, status_code=new_status or status_code, media_type=media_type, headers=headers)
+    # Headers for the rebuilt response, without the internal marker
+    headers = dict(response.headers)
+    headers.pop(GRAPHQL_ERRORS_HEADER, None)
+    try:
+        # Buffer the streaming body
+        chunks = []
+        async for chunk in response.body_iterator:
+            chunks.append(chunk)
+        body = b"".join(chunks)
+
+        status_code = response.status_code
+        media_type = response.media_type or "application/json"
+
+        new_status = None
+        try:
+            payload = orjson.loads(body or b"{}")
         except Exception:
-            # On any failure, return the original response with empty body if already consumed
-            return Response(content=b"", status_code=response.status_code, media_type=response.media_type, headers=dict(response.headers))
+            payload = None
+
+        if isinstance(payload, dict) and payload.get("errors"):
+            # Default to 400 for GraphQL errors
+            new_status = 400
+            # If duplicate-related errors detected, use 409 Conflict
+            if any(
+                isinstance(err, dict) and (err.get("extensions") or {}).get("code") == DUPLICATE_ERROR_CODE
+                for err in payload["errors"]
+            ):
+                new_status = 409
+
+        # Rebuild the response with potentially updated status code
+        return Response(content=body, status_code=new_status or status_code, media_type=media_type, headers=headers)
+    except Exception:
+        # On any failure, return the original response with empty body if already consumed
+        return Response(content=b"", status_code=response.status_code, media_type=response.media_type, headers=headers)
+
+
+async def get_context() -> dict:
+    """Build the per-request GraphQL context with fresh DataLoaders."""
+    return {"document_loader": make_document_loader()}
 
-    return response
 
 # Create the GraphQL router, which handles all GraphQL requests.
-graphql_app = GraphQLRouter(schema)
+graphql_app = GraphQLRouter(schema, context_getter=get_context)
 
 # Add the GraphQL endpoint to our FastAPI application.
 app.include_router(graphql_app, prefix="/graphql")